@@ -12,23 +12,7 @@ if str(ROOT) not in sys.path:
     sys.path.append(str(ROOT))
 
 from yolov6.utils.events import LOGGER
-from yolov6.core.inferer import Inferer
-
-import functools
-
-# Store the original torch.load function
-_original_torch_load = torch.load
-
-def custom_torch_load(*args, **kwargs):
-    # If 'weights_only' is not explicitly set, set it to False
-    if 'weights_only' not in kwargs:
-        kwargs['weights_only'] = False
-    print(f"DEBUG: torch.load called with weights_only={kwargs.get('weights_only', 'default_was_True_now_False')}") # Optional: for debugging
-    return _original_torch_load(*args, **kwargs)
-
-# Monkey-patch torch.load
-torch.load = custom_torch_load
-# --- END OF CUSTOM PATCH ---
+from yolov6.core.inferer import Inferer, CUDAGraphRunner
 
 
 def get_args_parser(add_help=True):
@@ -54,10 +38,13 @@ def get_args_parser(add_help=True):
     parser.add_argument('--hide-labels', default=False, action='store_true', help='hide labels.')
     parser.add_argument('--hide-conf', default=False, action='store_true', help='hide confidences.')
     parser.add_argument('--half', action='store_true', help='whether to use FP16 half-precision inference.')
-
-    args = parser.parse_args()
-    LOGGER.info(args)
-    return args
+    parser.add_argument('--batch-size', type=int, default=1, help='number of frames stacked into one forward pass.')
+    parser.add_argument('--compile', action='store_true', help='compile the model with torch.compile, the first frames pay the compilation cost.')
+    parser.add_argument('--cuda-graphs', action='store_true', help='replay the forward pass from a CUDA graph captured at the first input shape.')
+    parser.add_argument('--sort-by-size', action='store_true', help='infer images of a directory in descending file size order instead of by name.')
+    parser.add_argument('--channels-last', action='store_true', help='use NHWC (channels_last) memory format for model and inputs.')
+    parser.add_argument('--backend', type=str, default='torch', choices=['torch', 'trt', 'ort'], help='run --weights as a PyTorch checkpoint, TensorRT engine or ONNX model.')
+    return parser
 
 
 @torch.no_grad()
@@ -82,6 +69,12 @@ def run(weights=osp.join(ROOT, 'yolov6s.pt'),
         hide_labels=False,
         hide_conf=False,
         half=False,
+        batch_size=1,
+        compile=False,
+        cuda_graphs=False,
+        sort_by_size=False,
+        backend='torch',
+        channels_last=False,
         ):
     """ Inference process, supporting inference on one image file or directory which containing images.
     Args:
@@ -103,34 +96,67 @@ def run(weights=osp.join(ROOT, 'yolov6s.pt'),
         hide_labels: Hide labels, e.g. False
         hide_conf: Hide confidences
         half: Use FP16 half-precision inference, e.g. False
+        batch_size: Number of frames stacked into one forward pass, e.g. 1
+        compile: Compile the model with torch.compile, e.g. False
+        cuda_graphs: Replay the forward pass from a CUDA graph captured at the first input shape, e.g. False
+        sort_by_size: Infer images in descending file size order, e.g. False
+        backend: Run weights as a PyTorch checkpoint, TensorRT engine or ONNX model, e.g. 'torch'
+        channels_last: Use NHWC memory format for model and inputs, e.g. False
     """
+    if batch_size < 1:
+        raise ValueError(f'--batch-size must be a positive integer, got {batch_size}')
+
     # create save dir
     if save_dir is None:
         save_dir = osp.join(project, name)
         save_txt_path = osp.join(save_dir, 'labels')
     else:
         save_txt_path = save_dir
-    if (not not_save_img or save_txt) and not osp.exists(save_dir):
-        os.makedirs(save_dir)
-    else:
-        LOGGER.warning('Save directory already existed')
+    if not not_save_img or save_txt:
+        os.makedirs(save_dir, exist_ok=True)
     if save_txt:
         save_txt_path = osp.join(save_dir, 'labels')
-        if not osp.exists(save_txt_path):
-            os.makedirs(save_txt_path)
+        os.makedirs(save_txt_path, exist_ok=True)
 
     # Inference
-    inferer = Inferer(source, webcam, webcam_addr, weights, device, yaml, img_size, half)
-    inferer.infer(conf_thres, iou_thres, classes, agnostic_nms, max_det, save_dir, save_txt, not not_save_img, hide_labels, hide_conf, view_img)
+    # batched frames are letterboxed to img_size and webcam frames share one resolution, so cuDNN can autotune once
+    torch.backends.cudnn.benchmark = webcam or batch_size > 1
+    inferer = Inferer(source, webcam, webcam_addr, weights, device, yaml, img_size, half, backend, channels_last, sort_by_size)
+    if backend != 'torch' and (compile or cuda_graphs):
+        LOGGER.warning(f'--compile and --cuda-graphs only apply to the torch backend, ignored for {backend}.')
+        compile = cuda_graphs = False
+    if compile and cuda_graphs:
+        # mode='reduce-overhead' records its own CUDA graphs, capturing it again would nest one capture inside another
+        LOGGER.warning('--compile already uses CUDA graphs, --cuda-graphs is ignored.')
+        cuda_graphs = False
+    if compile:
+        # the JIT cost is paid by the warmup below (and again on each new input shape) and amortized over the source
+        inferer.model = torch.compile(inferer.model, mode='reduce-overhead')
+    # before wrapping in a CUDA graph, which is captured on the first real input shape
+    inferer.warmup(batch_size)
+    if cuda_graphs:
+        if inferer.device.type == 'cpu':
+            LOGGER.warning('CUDA graphs are not available on CPU, running the model eagerly.')
+        else:
+            # frames of other shapes than the captured one (varying webcam resolution, a smaller last batch) run eagerly
+            inferer.model = CUDAGraphRunner(inferer.model)
+    inferer.infer(conf_thres, iou_thres, classes, agnostic_nms, max_det, save_dir, save_txt, not not_save_img, hide_labels, hide_conf, view_img, batch_size)
 
     if save_txt or not not_save_img:
         LOGGER.info(f"Results saved to {save_dir}")
 
 
+def run_from_dict(cfg):
+    ''' Run inference from a dict of run() arguments without reading sys.argv,
+    e.g. run_from_dict({'weights': 'yolov6s.pt', 'source': 'data/images'}), missing keys take the CLI defaults. '''
+    run(**{**vars(get_args_parser().parse_args([])), **cfg})
+
+
 def main(args):
-    run(**vars(args))
+    run_from_dict(vars(args))
 
 
 if __name__ == "__main__":
-    args = get_args_parser()
+    args = get_args_parser().parse_args()
+    LOGGER.info(args)
     main(args)
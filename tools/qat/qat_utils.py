@@ -1,3 +1,4 @@
+import os
 from tqdm import tqdm
 import torch
 import torch.nn as nn
@@ -8,6 +9,7 @@ from pytorch_quantization import calib
 from pytorch_quantization.tensor_quant import QuantDescriptor
 
 from tools.partial_quantization.utils import set_module, module_quant_disable
+from yolov6.utils.events import LOGGER
 
 def collect_stats(model, data_loader, num_batches):
     """Feed data to the network and collect statistic"""
@@ -50,13 +52,45 @@ def compute_amax(model, **kwargs):
                     module.load_calib_amax(**kwargs)
     model.cuda()
 
-def ptq_calibrate(model, train_loader, cfg):
+def save_calib_cache(model, cache_path):
+    """Save the calibrated amax buffers of the quantizers"""
+    amaxes = {k: v for k, v in model.state_dict().items() if k.endswith('._amax')}
+    torch.save(amaxes, cache_path)
+
+def load_calib_cache(model, cache_path):
+    """Restore the amax buffers saved by save_calib_cache"""
+    amaxes = torch.load(cache_path, map_location='cpu', weights_only=False)
+    quantizers = {name + '._amax': module for name, module in model.named_modules()
+                  if isinstance(module, quant_nn.TensorQuantizer) and module._calibrator is not None}
+    # a quantizer that saw no data during calibration has no amax either, so a missing key is not necessarily a stale cache
+    missing = sorted(set(quantizers) - set(amaxes))
+    if missing:
+        LOGGER.warning(f'Calibration cache {cache_path} has no amax of these quantizers, they stay uncalibrated: {missing}. '
+                       'If the cache was made for another model or config, delete it to calibrate again.')
+    unexpected = sorted(set(amaxes) - set(quantizers))
+    if unexpected:
+        LOGGER.warning(f'Calibration cache {cache_path} has amax of unknown quantizers, ignored: {unexpected}')
+    for key, module in quantizers.items():
+        amax = amaxes[key].to(next(model.parameters()).device)
+        if hasattr(module, '_amax'):
+            module._amax.copy_(amax)
+        else:
+            module.register_buffer('_amax', amax)
+    model.cuda()
+
+def ptq_calibrate(model, train_loader, cfg, num_batches=None, cache_path=None):
     model.eval()
     model.cuda()
+    if cache_path and os.path.exists(cache_path):
+        LOGGER.info(f'Loading calibration cache from {cache_path}')
+        load_calib_cache(model, cache_path)
+        return
     # It is a bit slow since we collect histograms on CPU
     with torch.no_grad():
-        collect_stats(model, train_loader, cfg.ptq.calib_batches)
+        collect_stats(model, train_loader, num_batches if num_batches is not None else cfg.ptq.calib_batches)
         compute_amax(model, method=cfg.ptq.histogram_amax_method, percentile=cfg.ptq.histogram_amax_percentile)
+    if cache_path:
+        save_calib_cache(model, cache_path)
 
 def qat_init_model_manu(model, cfg, args):
     # print(model)
@@ -19,23 +19,8 @@ from yolov6.core.engine import Trainer
 from yolov6.utils.config import Config
 from yolov6.utils.events import LOGGER, save_yaml
 from yolov6.utils.envs import get_envs, select_device, set_random_seed
-from yolov6.utils.general import increment_name, find_latest_checkpoint, check_img_size
-
-import functools
-
-# Store the original torch.load function
-_original_torch_load = torch.load
-
-def custom_torch_load(*args, **kwargs):
-    # If 'weights_only' is not explicitly set, set it to False
-    if 'weights_only' not in kwargs:
-        kwargs['weights_only'] = False
-    print(f"DEBUG: torch.load called with weights_only={kwargs.get('weights_only', 'default_was_True_now_False')}") # Optional: for debugging
-    return _original_torch_load(*args, **kwargs)
-
-# Monkey-patch torch.load
-torch.load = custom_torch_load
-# --- END OF CUSTOM PATCH ---
+from yolov6.utils.general import increment_name, find_latest_checkpoint, check_img_size, check_version
+from tools.eval import boolean_string
 
 
 def get_args_parser(add_help=True):
@@ -59,6 +44,7 @@ def get_args_parser(add_help=True):
     parser.add_argument('--dist_url', default='env://', type=str, help='url used to set up distributed training')
     parser.add_argument('--gpu_count', type=int, default=0)
     parser.add_argument('--local_rank', type=int, default=-1, help='DDP parameter')
+    parser.add_argument('--nccl-debug', action='store_true', help='set NCCL_DEBUG=INFO to diagnose slow collectives')
     parser.add_argument('--resume', nargs='?', const=True, default=False, help='resume the most recent training')
     parser.add_argument('--write_trainbatch_tb', action='store_true', help='write train_batch image to tensorboard once an epoch, may slightly slower train speed if open')
     parser.add_argument('--stop_aug_last_n_epoch', default=15, type=int, help='stop strong aug at last n epoch, neg value not stop, default 15')
@@ -67,6 +53,8 @@ def get_args_parser(add_help=True):
     parser.add_argument('--distill_feat', action='store_true', help='distill featmap or not')
     parser.add_argument('--quant', action='store_true', help='quant or not')
     parser.add_argument('--calib', action='store_true', help='run ptq')
+    parser.add_argument('--calib-batches', type=int, default=None, help='number of batches to calibrate on, default is ptq.calib_batches of the config')
+    parser.add_argument('--calib-cache', type=str, default=None, help='calibration cache file, loaded if it exists, otherwise written after calibration')
     parser.add_argument('--teacher_model_path', type=str, default=None, help='teacher model path')
     parser.add_argument('--temperature', type=int, default=20, help='distill temperature')
     parser.add_argument('--fuse_ab', action='store_true', help='fuse ab branch in training process or not')
@@ -75,6 +63,10 @@ def get_args_parser(add_help=True):
     parser.add_argument('--height', type=int, default=None, help='image height of model input')
     parser.add_argument('--width', type=int, default=None, help='image width of model input')
     parser.add_argument('--cache-ram', action='store_true', help='whether to cache images into RAM to speed up training')
+    parser.add_argument('--prefetch-factor', default=2, type=int, help='number of batches loaded in advance by each worker')
+    parser.add_argument('--zero-grad-set-to-none', default=True, type=boolean_string, help='release gradients instead of zero-filling them after each optimizer step')
+    parser.add_argument('--channels-last', action='store_true', help='use NHWC (channels_last) memory format for model and inputs')
+    parser.add_argument('--amp', default='fp16', choices=['off', 'fp16', 'bf16'], help='mixed precision mode of forward and loss on GPU')
     return parser
 
 
@@ -89,8 +81,11 @@ def check_and_init(args):
         LOGGER.info(f'Resume training from the checkpoint file :{checkpoint_path}')
         resume_opt_file_path = Path(checkpoint_path).parent.parent / 'args.yaml'
         if osp.exists(resume_opt_file_path):
+            envs = args.local_rank, args.rank, args.world_size
             with open(resume_opt_file_path) as f:
-                args = argparse.Namespace(**yaml.safe_load(f))  # load args value from args.yaml
+                # load args value from args.yaml, options added after that run was started take their defaults
+                args = argparse.Namespace(**{**vars(get_args_parser().parse_args([])), **yaml.safe_load(f)})
+            args.local_rank, args.rank, args.world_size = envs  # keep the envs of this launch, not the saved ones
         else:
             LOGGER.warning(f'We can not find the path of {Path(checkpoint_path).parent.parent / "args.yaml"},'\
                            f' we will save exp log to {Path(checkpoint_path).parent.parent}')
@@ -100,7 +95,7 @@ def check_and_init(args):
     else:
         args.save_dir = str(increment_name(osp.join(args.output_dir, args.name)))
         if master_process:
-            os.makedirs(args.save_dir)
+            os.makedirs(args.save_dir, exist_ok=True)
 
     # check specific shape
     if args.specific_shape:
@@ -130,13 +125,22 @@ def main(args):
     # Setup
     args.local_rank, args.rank, args.world_size = get_envs()
     cfg, device, args = check_and_init(args)
-    # reload envs because args was chagned in check_and_init(args)
-    args.local_rank, args.rank, args.world_size = get_envs()
+    # input shape is fixed unless rect training, let cuDNN autotune conv algorithms once per shape and reuse them,
+    # except when set_random_seed asked for deterministic cuDNN, as autotuning may pick different algorithms per run
+    if not torch.backends.cudnn.deterministic:
+        torch.backends.cudnn.benchmark = not args.rect or args.specific_shape
     LOGGER.info(f'training args are: {args}\n')
     if args.local_rank != -1: # if DDP mode
         torch.cuda.set_device(args.local_rank)
         device = torch.device('cuda', args.local_rank)
         LOGGER.info('Initializing process group... ')
+        # NCCL runtime settings, must be set before the process group is created; user exported values win
+        # torch 2.2 renamed the variable and warns on every rank about the old name
+        os.environ.setdefault('TORCH_NCCL_ASYNC_ERROR_HANDLING' if check_version(torch.__version__, minimum='2.2.0')
+                              else 'NCCL_ASYNC_ERROR_HANDLING', '1')
+        os.environ.setdefault('TORCH_NCCL_AVOID_RECORD_STREAMS', '1')
+        if args.nccl_debug:
+            os.environ['NCCL_DEBUG'] = 'INFO'
         dist.init_process_group(backend="nccl" if dist.is_nccl_available() else "gloo", \
                 init_method=args.dist_url, rank=args.local_rank, world_size=args.world_size,timeout=datetime.timedelta(seconds=7200))
 
@@ -11,6 +11,8 @@ def generate_anchors(feats, fpn_strides, grid_cell_size=5.0, grid_cell_offset=0.
     num_anchors_list = []
     assert feats is not None
     if is_eval:
+        # stride may be a 0-dim cuda tensor, scale ones by it instead of passing it as the fill value of torch.full,
+        # which would read it back to host and break CUDA graph capture
         for i, stride in enumerate(fpn_strides):
             _, _, h, w = feats[i].shape
             shift_x = torch.arange(end=w, device=device) + grid_cell_offset
@@ -21,13 +23,13 @@ def generate_anchors(feats, fpn_strides, grid_cell_size=5.0, grid_cell_offset=0.
             if mode == 'af': # anchor-free
                 anchor_points.append(anchor_point.reshape([-1, 2]))
                 stride_tensor.append(
-                torch.full(
-                    (h * w, 1), stride, dtype=torch.float, device=device))
+                torch.ones(
+                    (h * w, 1), dtype=torch.float, device=device) * stride)
             elif mode == 'ab': # anchor-based
                 anchor_points.append(anchor_point.reshape([-1, 2]).repeat(3,1))
                 stride_tensor.append(
-                    torch.full(
-                        (h * w, 1), stride, dtype=torch.float, device=device).repeat(3,1))
+                    (torch.ones(
+                        (h * w, 1), dtype=torch.float, device=device) * stride).repeat(3,1))
         anchor_points = torch.cat(anchor_points)
         stride_tensor = torch.cat(stride_tensor)
         return anchor_points, stride_tensor
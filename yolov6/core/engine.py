@@ -41,9 +41,12 @@ class Trainer:
         self.cfg = cfg
         self.device = device
         self.max_epoch = args.epochs
+        # mixed precision, fp16 needs loss scaling while bf16 has the fp32 exponent range
+        self.amp_enabled = args.amp != 'off' and device.type != 'cpu'
+        self.amp_dtype = torch.bfloat16 if args.amp == 'bf16' else torch.float16
 
         if args.resume:
-            self.ckpt = torch.load(args.resume, map_location='cpu')
+            self.ckpt = torch.load(args.resume, map_location='cpu', weights_only=False)
 
         self.rank = args.rank
         self.local_rank = args.local_rank
@@ -56,11 +59,15 @@ class Trainer:
         # get model and optimizer
         self.distill_ns = True if self.args.distill and self.cfg.model.type in ['YOLOv6n','YOLOv6s'] else False
         model = self.get_model(args, cfg, self.num_classes, device)
+        if self.args.channels_last:
+            model = model.to(memory_format=torch.channels_last)
         if self.args.distill:
             if self.args.fuse_ab:
                 LOGGER.error('ERROR in: Distill models should turn off the fuse_ab.\n')
                 exit()
             self.teacher_model = self.get_teacher_model(args, cfg, self.num_classes, device)
+            if self.args.channels_last:
+                self.teacher_model = self.teacher_model.to(memory_format=torch.channels_last)
         if self.args.quant:
             self.quant_setup(model, cfg, device)
         if cfg.training_mode == 'repopt':
@@ -141,13 +148,15 @@ class Trainer:
     # Training one batch data.
     def train_in_steps(self, epoch_num, step_num):
         images, targets = self.prepro_data(self.batch_data, self.device)
+        if self.args.channels_last:
+            images = images.contiguous(memory_format=torch.channels_last)
         # plot train_batch and save to tensorboard once an epoch
         if self.write_trainbatch_tb and self.main_process and self.step == 0:
             self.plot_train_batch(images, targets)
             write_tbimg(self.tblogger, self.vis_train_batch, self.step + self.max_stepnum * self.epoch, type='train')
 
         # forward
-        with amp.autocast(enabled=self.device != 'cpu'):
+        with amp.autocast(enabled=self.amp_enabled, dtype=self.amp_dtype):
             _, _, batch_height, batch_width = images.shape
             preds, s_featmaps = self.model(images)
             if self.args.distill:
@@ -275,7 +284,7 @@ class Trainer:
         self.warmup_stepnum = max(round(self.cfg.solver.warmup_epochs * self.max_stepnum), 1000) if self.args.quant is False else 0
         self.scheduler.last_epoch = self.start_epoch - 1
         self.last_opt_step = -1
-        self.scaler = amp.GradScaler(enabled=self.device != 'cpu')
+        self.scaler = amp.GradScaler(enabled=self.amp_enabled and self.amp_dtype == torch.float16)
 
         self.best_ap, self.ap = 0.0, 0.0
         self.best_stop_strong_aug_ap = 0.0
@@ -332,7 +341,7 @@ class Trainer:
         if self.rank != -1:
             self.train_loader.sampler.set_epoch(self.epoch)
         self.mean_loss = torch.zeros(self.loss_num, device=self.device)
-        self.optimizer.zero_grad()
+        self.zero_grad()
 
         LOGGER.info(('\n' + '%10s' * (self.loss_num + 2)) % (*self.loss_info,))
         self.pbar = enumerate(self.train_loader)
@@ -370,11 +379,17 @@ class Trainer:
         if curr_step - self.last_opt_step >= self.accumulate:
             self.scaler.step(self.optimizer)
             self.scaler.update()
-            self.optimizer.zero_grad()
+            self.zero_grad()
             if self.ema:
                 self.ema.update(self.model)
             self.last_opt_step = curr_step
 
+    def zero_grad(self):
+        try:
+            self.optimizer.zero_grad(set_to_none=self.args.zero_grad_set_to_none)
+        except TypeError:  # custom optimizer whose zero_grad takes no arguments
+            self.optimizer.zero_grad()
+
     @staticmethod
     def get_data_loader(args, cfg, data_dict):
         train_path, val_path = data_dict['train'], data_dict['val']
@@ -389,7 +404,7 @@ class Trainer:
                                          workers=args.workers, shuffle=True, check_images=args.check_images,
                                          check_labels=args.check_labels, data_dict=data_dict, task='train',
                                          specific_shape=args.specific_shape, height=args.height, width=args.width,
-                                         cache_ram=args.cache_ram)[0]
+                                         cache_ram=args.cache_ram, prefetch_factor=args.prefetch_factor)[0]
         # create val dataloader
         val_loader = None
         if args.rank in [-1, 0]:
@@ -399,7 +414,7 @@ class Trainer:
                                            workers=args.workers, check_images=args.check_images,
                                            check_labels=args.check_labels, data_dict=data_dict, task='val',
                                            specific_shape=args.specific_shape, height=args.height, width=args.width,
-                                           cache_ram=args.cache_ram)[0]
+                                           cache_ram=args.cache_ram, prefetch_factor=args.prefetch_factor)[0]
 
         return train_loader, val_loader
 
@@ -447,7 +462,7 @@ class Trainer:
         if not weights:
             LOGGER.error("ERROR: No scales provided to init RepOptimizer!")
         else:
-            ckpt = torch.load(weights, map_location=device)
+            ckpt = torch.load(weights, map_location=device, weights_only=False)
             scales = extract_scales(ckpt)
         return scales
 
@@ -565,13 +580,12 @@ class Trainer:
             if cfg.ptq.sensitive_layers_skip is True:
                 output_model_path = output_model_path.replace('.pt', '_partial.pt')
             LOGGER.info('Saving calibrated model to {}... '.format(output_model_path))
-            if not os.path.exists(cfg.ptq.calib_output_path):
-                os.mkdir(cfg.ptq.calib_output_path)
+            os.makedirs(cfg.ptq.calib_output_path, exist_ok=True)
             torch.save({'model': deepcopy(de_parallel(model)).half()}, output_model_path)
         assert self.args.quant is True and self.args.calib is True
         if self.main_process:
             from tools.qat.qat_utils import ptq_calibrate
-            ptq_calibrate(self.model, self.train_loader, cfg)
+            ptq_calibrate(self.model, self.train_loader, cfg, self.args.calib_batches, self.args.calib_cache)
             self.epoch = 0
             self.eval_model()
             save_calib_model(self.model, cfg)
@@ -590,5 +604,5 @@ class Trainer:
                     skip_sensitive_layers(model, cfg.qat.sensitive_layers_list)
                 # QAT flow load calibrated model
                 assert cfg.qat.calib_pt is not None, 'Please provide calibrated model'
-                model.load_state_dict(torch.load(cfg.qat.calib_pt)['model'].float().state_dict())
+                model.load_state_dict(torch.load(cfg.qat.calib_pt, weights_only=False)['model'].float().state_dict())
             model.to(device)
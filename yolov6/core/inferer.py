@@ -4,6 +4,8 @@ import os
 import cv2
 import time
 import math
+import queue
+import threading
 import torch
 import numpy as np
 import os.path as osp
@@ -14,14 +16,14 @@ from PIL import ImageFont
 from collections import deque
 
 from yolov6.utils.events import LOGGER, load_yaml
-from yolov6.layers.common import DetectBackend
+from yolov6.layers.common import DetectBackend, TRTBackend, ORTBackend
 from yolov6.data.data_augment import letterbox
 from yolov6.data.datasets import LoadData
 from yolov6.utils.nms import non_max_suppression
 from yolov6.utils.torch_utils import get_model_info
 
 class Inferer:
-    def __init__(self, source, webcam, webcam_addr, weights, device, yaml, img_size, half):
+    def __init__(self, source, webcam, webcam_addr, weights, device, yaml, img_size, half, backend='torch', channels_last=False, sort_by_size=False):
 
         self.__dict__.update(locals())
 
@@ -30,32 +32,65 @@ class Inferer:
         self.img_size = img_size
         cuda = self.device != 'cpu' and torch.cuda.is_available()
         self.device = torch.device(f'cuda:{device}' if cuda else 'cpu')
-        self.model = DetectBackend(weights, device=self.device)
-        self.stride = self.model.stride
         self.class_names = load_yaml(yaml)['names']
-        self.img_size = self.check_img_size(self.img_size, s=self.stride)  # check image size
-        self.half = half
+        self.backend = backend
+        if backend != 'torch':
+            self.init_exported_model(weights)
+        else:
+            self.model = DetectBackend(weights, device=self.device)
+            self.stride = self.model.stride
+            self.img_size = self.check_img_size(self.img_size, s=self.stride)  # check image size
+            self.half = half
 
-        # Switch model to deploy status
-        self.model_switch(self.model.model, self.img_size)
+            # Switch model to deploy status
+            self.model_switch(self.model.model, self.img_size)
 
-        # Half precision
-        if self.half & (self.device.type != 'cpu'):
-            self.model.model.half()
-        else:
-            self.model.model.float()
-            self.half = False
+            # Half precision
+            if self.half & (self.device.type != 'cpu'):
+                self.model.model.half()
+            else:
+                self.model.model.float()
+                self.half = False
 
-        if self.device.type != 'cpu':
-            self.model(torch.zeros(1, 3, *self.img_size).to(self.device).type_as(next(self.model.model.parameters())))  # warmup
+            # NHWC memory format for conv kernels that prefer it, inputs are converted in infer()
+            if channels_last:
+                self.model.model.to(memory_format=torch.channels_last)
+        self.channels_last = channels_last and backend == 'torch'
 
         # Load data
         self.webcam = webcam
         self.webcam_addr = webcam_addr
-        self.files = LoadData(source, webcam, webcam_addr)
+        self.files = LoadData(source, webcam, webcam_addr, sort_by_size)
         self.source = source
 
 
+    def warmup(self, batch_size=1, n=3):
+        ''' Run dummy forwards at the inference input shape, front-loading allocation, cuDNN autotuning and compilation '''
+        if self.device.type == 'cpu':
+            return
+        img = torch.zeros(batch_size, 3, *self.img_size, device=self.device, dtype=torch.float16 if self.half else torch.float32)
+        if self.channels_last:
+            img = img.contiguous(memory_format=torch.channels_last)
+        with torch.no_grad():
+            for _ in range(n):
+                self.model(img)
+        torch.cuda.synchronize(self.device)
+
+    def init_exported_model(self, weights):
+        ''' Load a TensorRT engine or an ONNX model, whose input shape and precision are frozen at export '''
+        if self.backend == 'trt':
+            assert self.device.type != 'cpu', 'TensorRT backend needs a CUDA device.'
+            self.model = TRTBackend(weights, device=self.device)
+        else:
+            self.model = ORTBackend(weights, device=self.device)
+        self.stride = 32
+        # normalize frames straight to the input dtype of the exported model on device, instead of fp32 and a second cast
+        self.half = self.model.input_dtype == np.float16 and self.device.type != 'cpu'
+        export_size = list(self.model.input_shape[2:])
+        if export_size != self.check_img_size(self.img_size, s=self.stride):
+            LOGGER.warning(f'--img-size {self.img_size} does not match the exported model, using {export_size}')
+        self.img_size = export_size
+
     def model_switch(self, model, img_size):
         ''' Model switch to deploy status '''
         from yolov6.layers.common import RepVGGBlock
@@ -67,104 +102,181 @@ class Inferer:
 
         LOGGER.info("Switch model to deploy modality.")
 
-    def infer(self, conf_thres, iou_thres, classes, agnostic_nms, max_det, save_dir, save_txt, save_img, hide_labels, hide_conf, view_img=True):
+    def infer(self, conf_thres, iou_thres, classes, agnostic_nms, max_det, save_dir, save_txt, save_img, hide_labels, hide_conf, view_img=True, batch_size=1):
         ''' Model Inference and results visualization '''
         vid_path, vid_writer, windows = None, None, []
         fps_calculator = CalcFPS()
-        for img_src, img_path, vid_cap in tqdm(self.files):
-            img, img_src = self.process_image(img_src, self.img_size, self.stride, self.half)
-            img = img.to(self.device)
-            if len(img.shape) == 3:
-                img = img[None]
-                # expand for batch dim
+        stager = PinnedStager(self.device)
+        pbar = tqdm(total=len(self.files))
+        for frames, images in self.prefetch(batch_size):
+            img = stager(images, self.half)
+            if self.channels_last:
+                img = img.contiguous(memory_format=torch.channels_last)
             t1 = time.time()
             pred_results = self.model(img)
-            det = non_max_suppression(pred_results, conf_thres, iou_thres, classes, agnostic_nms, max_det=max_det)[0]
+            dets = non_max_suppression(pred_results, conf_thres, iou_thres, classes, agnostic_nms, max_det=max_det)
             t2 = time.time()
+            pbar.update(len(frames))
+
+            for det, (img_src, img_path, video_info, file_type) in zip(dets, frames):
+                if self.webcam:
+                    save_path = osp.join(save_dir, self.webcam_addr)
+                    txt_path = osp.join(save_dir, self.webcam_addr)
+                else:
+                    # Create output files in nested dirs that mirrors the structure of the images' dirs
+                    rel_path = osp.relpath(osp.dirname(img_path), osp.dirname(self.source))
+                    save_path = osp.join(save_dir, rel_path, osp.basename(img_path))  # im.jpg
+                    txt_path = osp.join(save_dir, rel_path, 'labels', osp.splitext(osp.basename(img_path))[0])
+                    os.makedirs(osp.join(save_dir, rel_path), exist_ok=True)
+
+                gn = torch.tensor(img_src.shape)[[1, 0, 1, 0]]  # normalization gain whwh
+                img_ori = img_src.copy()
+
+                # check image and font
+                assert img_ori.data.contiguous, 'Image needs to be contiguous. Please apply to input images with np.ascontiguousarray(im).'
+                self.font_check()
+
+                if len(det):
+                    det[:, :4] = self.rescale(img.shape[2:], det[:, :4], img_src.shape).round()
+                    for *xyxy, conf, cls in reversed(det):
+                        if save_txt:  # Write to file
+                            xywh = (self.box_convert(torch.tensor(xyxy).view(1, 4)) / gn).view(-1).tolist()  # normalized xywh
+                            line = (cls, *xywh, conf)
+                            with open(txt_path + '.txt', 'a') as f:
+                                f.write(('%g ' * len(line)).rstrip() % line + '\n')
+
+                        if save_img:
+                            class_num = int(cls)  # integer class
+                            label = None if hide_labels else (self.class_names[class_num] if hide_conf else f'{self.class_names[class_num]} {conf:.2f}')
+
+                            self.plot_box_and_label(img_ori, max(round(sum(img_ori.shape) / 2 * 0.003), 2), xyxy, label, color=self.generate_colors(class_num, True))
+
+                    img_src = np.asarray(img_ori)
+
+                # FPS counter
+                fps_calculator.update(len(frames) / (t2 - t1))
+                avg_fps = fps_calculator.accumulate()
+
+                if file_type == 'video':
+                    self.draw_text(
+                        img_src,
+                        f"FPS: {avg_fps:0.1f}",
+                        pos=(20, 20),
+                        font_scale=1.0,
+                        text_color=(204, 85, 17),
+                        text_color_bg=(255, 255, 255),
+                        font_thickness=2,
+                    )
+
+                if view_img:
+                    if img_path not in windows:
+                        windows.append(img_path)
+                        cv2.namedWindow(str(img_path), cv2.WINDOW_NORMAL | cv2.WINDOW_KEEPRATIO)  # allow window resize (Linux)
+                        cv2.resizeWindow(str(img_path), img_src.shape[1], img_src.shape[0])
+                    cv2.imshow(str(img_path), img_src)
+                    cv2.waitKey(1)  # 1 millisecond
+
+                # Save results (image with detections)
+                if save_img:
+                    if file_type == 'image':
+                        cv2.imwrite(save_path, img_src)
+                    else:  # 'video' or 'stream'
+                        if vid_path != save_path:  # new video
+                            vid_path = save_path
+                            if isinstance(vid_writer, cv2.VideoWriter):
+                                vid_writer.release()  # release previous video writer
+                            if video_info:  # video
+                                fps, w, h = video_info
+                            else:  # stream
+                                fps, w, h = 30, img_ori.shape[1], img_ori.shape[0]
+                            save_path = str(Path(save_path).with_suffix('.mp4'))  # force *.mp4 suffix on results videos
+                            vid_writer = cv2.VideoWriter(save_path, cv2.VideoWriter_fourcc(*'mp4v'), fps, (w, h))
+                        vid_writer.write(img_src)
+        pbar.close()
+
+    def read_frames(self):
+        '''Yield frames of the data loader with the video writer info and file type of each frame, recorded at read time.'''
+        for img_src, img_path, vid_cap in self.files:
+            # the loader may run ahead of the consumer and release a finished capture, so read its properties now
+            video_info = (vid_cap.get(cv2.CAP_PROP_FPS), int(vid_cap.get(cv2.CAP_PROP_FRAME_WIDTH)),
+                          int(vid_cap.get(cv2.CAP_PROP_FRAME_HEIGHT))) if vid_cap else None
+            yield img_src, img_path, video_info, self.files.checkext(img_path)
+
+    def prepare_batches(self, batch_size):
+        '''Yield batches of frames together with their letterboxed uint8 images.'''
+        # letterbox without minimum-rectangle padding when batching or running an exported model, so all frames share img_size
+        auto = batch_size == 1 and self.backend == 'torch'
+        for frames in self.batch_frames(self.read_frames(), batch_size):
+            yield frames, [self.prepare_image(frame[0], self.img_size, self.stride, auto=auto) for frame in frames]
+
+    def prefetch(self, batch_size, maxsize=2):
+        '''Read and letterbox batches of frames in a background thread, overlapping it with model inference.'''
+        if self.webcam:
+            # read-ahead would only add stale frames of latency on a live stream
+            yield from self.prepare_batches(batch_size)
+            return
+
+        batches = queue.Queue(maxsize=maxsize)
+        stop = threading.Event()
+
+        def put(item):
+            # time out now and then to notice a consumer that stopped early, instead of blocking on a full queue forever
+            while not stop.is_set():
+                try:
+                    batches.put(item, timeout=0.1)
+                    return True
+                except queue.Full:
+                    pass
+            return False
+
+        def produce():
+            try:
+                for batch in self.prepare_batches(batch_size):
+                    if not put(batch):
+                        break
+                else:
+                    put(None)  # end of data
+            except Exception as e:
+                put(e)
+            finally:
+                if self.files.cap is not None:
+                    self.files.cap.release()
+
+        threading.Thread(target=produce, daemon=True).start()
+        try:
+            while True:
+                batch = batches.get()
+                if batch is None:
+                    return
+                if isinstance(batch, Exception):
+                    raise batch
+                yield batch
+        finally:
+            stop.set()
 
-            if self.webcam:
-                save_path = osp.join(save_dir, self.webcam_addr)
-                txt_path = osp.join(save_dir, self.webcam_addr)
-            else:
-                # Create output files in nested dirs that mirrors the structure of the images' dirs
-                rel_path = osp.relpath(osp.dirname(img_path), osp.dirname(self.source))
-                save_path = osp.join(save_dir, rel_path, osp.basename(img_path))  # im.jpg
-                txt_path = osp.join(save_dir, rel_path, 'labels', osp.splitext(osp.basename(img_path))[0])
-                os.makedirs(osp.join(save_dir, rel_path), exist_ok=True)
-
-            gn = torch.tensor(img_src.shape)[[1, 0, 1, 0]]  # normalization gain whwh
-            img_ori = img_src.copy()
-
-            # check image and font
-            assert img_ori.data.contiguous, 'Image needs to be contiguous. Please apply to input images with np.ascontiguousarray(im).'
-            self.font_check()
-
-            if len(det):
-                det[:, :4] = self.rescale(img.shape[2:], det[:, :4], img_src.shape).round()
-                for *xyxy, conf, cls in reversed(det):
-                    if save_txt:  # Write to file
-                        xywh = (self.box_convert(torch.tensor(xyxy).view(1, 4)) / gn).view(-1).tolist()  # normalized xywh
-                        line = (cls, *xywh, conf)
-                        with open(txt_path + '.txt', 'a') as f:
-                            f.write(('%g ' * len(line)).rstrip() % line + '\n')
-
-                    if save_img:
-                        class_num = int(cls)  # integer class
-                        label = None if hide_labels else (self.class_names[class_num] if hide_conf else f'{self.class_names[class_num]} {conf:.2f}')
-
-                        self.plot_box_and_label(img_ori, max(round(sum(img_ori.shape) / 2 * 0.003), 2), xyxy, label, color=self.generate_colors(class_num, True))
-
-                img_src = np.asarray(img_ori)
-
-            # FPS counter
-            fps_calculator.update(1.0 / (t2 - t1))
-            avg_fps = fps_calculator.accumulate()
-
-            if self.files.type == 'video':
-                self.draw_text(
-                    img_src,
-                    f"FPS: {avg_fps:0.1f}",
-                    pos=(20, 20),
-                    font_scale=1.0,
-                    text_color=(204, 85, 17),
-                    text_color_bg=(255, 255, 255),
-                    font_thickness=2,
-                )
-
-            if view_img:
-                if img_path not in windows:
-                    windows.append(img_path)
-                    cv2.namedWindow(str(img_path), cv2.WINDOW_NORMAL | cv2.WINDOW_KEEPRATIO)  # allow window resize (Linux)
-                    cv2.resizeWindow(str(img_path), img_src.shape[1], img_src.shape[0])
-                cv2.imshow(str(img_path), img_src)
-                cv2.waitKey(1)  # 1 millisecond
-
-            # Save results (image with detections)
-            if save_img:
-                if self.files.type == 'image':
-                    cv2.imwrite(save_path, img_src)
-                else:  # 'video' or 'stream'
-                    if vid_path != save_path:  # new video
-                        vid_path = save_path
-                        if isinstance(vid_writer, cv2.VideoWriter):
-                            vid_writer.release()  # release previous video writer
-                        if vid_cap:  # video
-                            fps = vid_cap.get(cv2.CAP_PROP_FPS)
-                            w = int(vid_cap.get(cv2.CAP_PROP_FRAME_WIDTH))
-                            h = int(vid_cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
-                        else:  # stream
-                            fps, w, h = 30, img_ori.shape[1], img_ori.shape[0]
-                        save_path = str(Path(save_path).with_suffix('.mp4'))  # force *.mp4 suffix on results videos
-                        vid_writer = cv2.VideoWriter(save_path, cv2.VideoWriter_fourcc(*'mp4v'), fps, (w, h))
-                    vid_writer.write(img_src)
+    @staticmethod
+    def batch_frames(files, batch_size):
+        '''Group the frames yielded by files into lists of at most batch_size frames.'''
+        frames = []
+        for frame in files:
+            frames.append(frame)
+            if len(frames) == batch_size:
+                yield frames
+                frames = []
+        if frames:
+            yield frames
 
     @staticmethod
-    def process_image(img_src, img_size, stride, half):
-        '''Process image before image inference.'''
-        image = letterbox(img_src, img_size, stride=stride)[0]
-        # Convert
+    def prepare_image(img_src, img_size, stride, auto=True):
+        '''Letterbox image and convert it to a contiguous uint8 CHW RGB array.'''
+        image = letterbox(img_src, img_size, stride=stride, auto=auto)[0]
         image = image.transpose((2, 0, 1))[::-1]  # HWC to CHW, BGR to RGB
-        image = torch.from_numpy(np.ascontiguousarray(image))
+        return np.ascontiguousarray(image)
+
+    @staticmethod
+    def process_image(img_src, img_size, stride, half):
+        '''Process image before image inference, kept for external callers, infer() stages uint8 frames through prepare_image.'''
+        image = torch.from_numpy(Inferer.prepare_image(img_src, img_size, stride))
         image = image.half() if half else image.float()  # uint8 to fp16/32
         image /= 255  # 0 - 255 to 0.0 - 1.0
 
@@ -293,3 +405,73 @@ class CalcFPS:
             return np.average(self.framerate)
         else:
             return 0.0
+
+
+class PinnedStager:
+    '''Reusable page-locked host buffers, keyed by batch shape, for staging uint8 frames before the H2D copy.'''
+    def __init__(self, device):
+        self.device = device
+        self.pin_memory = device.type != 'cpu'
+        self.stream = torch.cuda.Stream(device) if self.pin_memory else None  # side stream for H2D copies
+        self.buffers = {}
+
+    def __call__(self, images, half=False):
+        '''Copy uint8 CHW arrays into a staging buffer and return them on device as a normalized float batch.'''
+        shape = (len(images), *images[0].shape)
+        if shape not in self.buffers:
+            self.buffers[shape] = (torch.empty(shape, dtype=torch.uint8, pin_memory=self.pin_memory), None)
+        buffer, copied = self.buffers[shape]
+        if copied is not None:
+            copied.synchronize()  # the previous async copy out of this buffer must finish before it is overwritten
+        for i, image in enumerate(images):
+            buffer[i].copy_(torch.from_numpy(image))
+        if not self.pin_memory:
+            return buffer.to(dtype=torch.float16 if half else torch.float32).div_(255)  # 0 - 255 to 0.0 - 1.0
+
+        with torch.cuda.stream(self.stream):
+            img = buffer.to(self.device, non_blocking=True)
+            copied = torch.cuda.Event()
+            copied.record()
+            self.buffers[shape] = (buffer, copied)
+            img = img.to(dtype=torch.float16 if half else torch.float32).div_(255)
+        compute_stream = torch.cuda.current_stream(self.device)
+        compute_stream.wait_stream(self.stream)
+        img.record_stream(compute_stream)
+        return img
+
+
+class CUDAGraphRunner:
+    '''Capture the forward pass of a model into a CUDA graph on the first call and replay it for inputs of the same shape.'''
+    def __init__(self, model, warmup=3):
+        self.model = model
+        self.warmup = warmup
+        self.graph = None
+        self.eager = False
+
+    def capture(self, x):
+        self.static_input = x.clone()
+        stream = torch.cuda.Stream(x.device)
+        stream.wait_stream(torch.cuda.current_stream(x.device))
+        with torch.cuda.stream(stream):  # warmup on a side stream before capture, as required by CUDA graphs
+            for _ in range(self.warmup):
+                self.model(self.static_input)
+        torch.cuda.current_stream(x.device).wait_stream(stream)
+        self.graph = torch.cuda.CUDAGraph()
+        with torch.cuda.graph(self.graph):
+            self.static_output = self.model(self.static_input)
+
+    def __call__(self, x):
+        if self.eager:
+            return self.model(x)
+        if self.graph is None:
+            try:
+                self.capture(x)
+            except Exception as e:
+                LOGGER.warning(f'CUDA graph capture failed, running the model eagerly: {e}')
+                self.eager = True
+                return self.model(x)
+        elif x.shape != self.static_input.shape or x.dtype != self.static_input.dtype:
+            return self.model(x)  # e.g. a smaller last batch, run it eagerly
+        self.static_input.copy_(x, non_blocking=True)
+        self.graph.replay()
+        return self.static_output.clone()
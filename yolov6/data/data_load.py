@@ -31,7 +31,8 @@ def create_dataloader(
     specific_shape=False,
     height=1088,
     width=1920,
-    cache_ram=False
+    cache_ram=False,
+    prefetch_factor=2
     ):
     """Create general dataloader.
 
@@ -79,6 +80,8 @@ def create_dataloader(
     sampler = (
         None if rank == -1 else distributed.DistributedSampler(dataset, shuffle=shuffle, drop_last=drop_last)
     )
+    # prefetch_factor is only accepted when loading with worker processes
+    worker_kwargs = dict(prefetch_factor=prefetch_factor) if workers > 0 else {}
     return (
         TrainValDataLoader(
             dataset,
@@ -88,6 +91,7 @@ def create_dataloader(
             sampler=sampler,
             pin_memory=True,
             collate_fn=TrainValDataset.collate_fn,
+            **worker_kwargs,
         ),
         dataset,
     )
@@ -660,7 +660,7 @@ class TrainValDataset(Dataset):
 
 
 class LoadData:
-    def __init__(self, path, webcam, webcam_addr):
+    def __init__(self, path, webcam, webcam_addr, sort_by_size=False):
         self.webcam = webcam
         self.webcam_addr = webcam_addr
         if webcam: # if use web camera
@@ -676,6 +676,9 @@ class LoadData:
                 raise FileNotFoundError(f'Invalid path {p}')
             imgp = [i for i in files if i.split('.')[-1] in IMG_FORMATS]
             vidp = [v for v in files if v.split('.')[-1] in VID_FORMATS]
+            if sort_by_size:
+                # largest images first, so batches hold frames of similar size
+                imgp.sort(key=os.path.getsize, reverse=True)
         self.files = imgp + vidp
         self.nf = len(self.files)
         self.type = 'image'
@@ -566,6 +566,68 @@ class DetectBackend(nn.Module):
         return y
 
 
+def pad_batch(im, batch_size):
+    '''Pad im with zero images up to batch_size, for models exported with a fixed batch size.'''
+    if isinstance(batch_size, int):
+        assert im.shape[0] <= batch_size, f'--batch-size {im.shape[0]} exceeds the batch size {batch_size} of the exported model.'
+    if isinstance(batch_size, int) and im.shape[0] < batch_size:
+        im = torch.cat([im, im.new_zeros(batch_size - im.shape[0], *im.shape[1:])], 0)
+    return im
+
+
+class TRTBackend:
+    '''Run a TensorRT engine exported without NMS (deploy/ONNX/export_onnx.py without --end2end, then trtexec).'''
+    def __init__(self, weights='yolov6s.engine', device=None):
+        import tensorrt as trt
+        from collections import namedtuple, OrderedDict
+        Binding = namedtuple('Binding', ('name', 'dtype', 'shape', 'data', 'ptr'))
+        logger = trt.Logger(trt.Logger.ERROR)
+        trt.init_libnvinfer_plugins(logger, namespace="")
+        with open(weights, 'rb') as f, trt.Runtime(logger) as runtime:
+            engine = runtime.deserialize_cuda_engine(f.read())
+        self.bindings = OrderedDict()
+        for index in range(engine.num_bindings):
+            name = engine.get_binding_name(index)
+            dtype = trt.nptype(engine.get_binding_dtype(index))
+            shape = tuple(engine.get_binding_shape(index))
+            assert all(dim > 0 for dim in shape), f'binding {name} has dynamic shape {shape}, ' \
+                'TensorRT backend only supports engines built with a fixed batch size (export ONNX without --dynamic-batch).'
+            data = torch.from_numpy(np.empty(shape, dtype=np.dtype(dtype))).to(device)
+            self.bindings[name] = Binding(name, dtype, shape, data, int(data.data_ptr()))
+        self.binding_addrs = OrderedDict((n, d.ptr) for n, d in self.bindings.items())
+        self.context = engine.create_execution_context()
+        self.input_shape = self.bindings['images'].shape
+        self.input_dtype = self.bindings['images'].dtype
+        self.device = device
+
+    def __call__(self, im):
+        nb = im.shape[0]
+        im = pad_batch(im, self.input_shape[0]).to(self.bindings['images'].data.dtype).contiguous()
+        torch.cuda.current_stream(self.device).synchronize()  # execute_v2 does not run on the torch stream
+        self.binding_addrs['images'] = int(im.data_ptr())
+        self.context.execute_v2(list(self.binding_addrs.values()))
+        return self.bindings['outputs'].data[:nb].float().clone()  # the output buffer is overwritten by the next call
+
+
+class ORTBackend:
+    '''Run an ONNX model exported without NMS (deploy/ONNX/export_onnx.py without --end2end) with ONNX Runtime.'''
+    def __init__(self, weights='yolov6s.onnx', device=None):
+        import onnxruntime as ort
+        providers = ['CUDAExecutionProvider', 'CPUExecutionProvider'] if device.type != 'cpu' else ['CPUExecutionProvider']
+        self.session = ort.InferenceSession(weights, providers=providers)
+        image_input = self.session.get_inputs()[0]
+        self.input_name = image_input.name
+        self.input_shape = tuple(image_input.shape)  # the batch dim is a name if exported with --dynamic-batch
+        self.input_dtype = np.float16 if image_input.type == 'tensor(float16)' else np.float32
+        self.device = device
+
+    def __call__(self, im):
+        nb = im.shape[0]
+        im = pad_batch(im, self.input_shape[0]).cpu().numpy().astype(self.input_dtype)
+        y = self.session.run(None, {self.input_name: im})[0]
+        return torch.from_numpy(y[:nb]).to(self.device).float()
+
+
 class RepBlock(nn.Module):
     '''
         RepBlock is a stage block with rep-style basic block
@@ -8,10 +8,19 @@ from yolov6.utils.events import LOGGER
 from yolov6.utils.torch_utils import fuse_model
 
 
+def load_weights(weights, map_location=None):
+    """Load a .pt checkpoint dict, or the state_dict stored in a .safetensors file."""
+    LOGGER.debug('Loading weights from %s with map_location=%s', weights, map_location)  # formatted only if DEBUG is enabled
+    if str(weights).endswith('.safetensors'):
+        from safetensors.torch import load_file  # optional dependency, only needed for .safetensors weights
+        return load_file(weights, device=str(map_location) if map_location is not None else 'cpu')
+    return torch.load(weights, map_location=map_location, weights_only=False)
+
+
 def load_state_dict(weights, model, map_location=None):
     """Load weights from checkpoint file, only assign weights those layers' name and shape are match."""
-    ckpt = torch.load(weights, map_location=map_location)
-    state_dict = ckpt['model'].float().state_dict()
+    ckpt = load_weights(weights, map_location=map_location)
+    state_dict = ckpt if str(weights).endswith('.safetensors') else ckpt['model'].float().state_dict()
     model_state_dict = model.state_dict()
     state_dict = {k: v for k, v in state_dict.items() if k in model_state_dict and v.shape == model_state_dict[k].shape}
     model.load_state_dict(state_dict, strict=False)
@@ -22,7 +31,7 @@ def load_state_dict(weights, model, map_location=None):
 def load_checkpoint(weights, map_location=None, inplace=True, fuse=True):
     """Load model from checkpoint file."""
     LOGGER.info("Loading checkpoint from {}".format(weights))
-    ckpt = torch.load(weights, map_location=map_location)  # load
+    ckpt = torch.load(weights, map_location=map_location, weights_only=False)  # load
     model = ckpt['ema' if ckpt.get('ema') else 'model'].float()
     if fuse:
         LOGGER.info("\nFusing model...")
@@ -34,8 +43,7 @@ def load_checkpoint(weights, map_location=None, inplace=True, fuse=True):
 
 def save_checkpoint(ckpt, is_best, save_dir, model_name=""):
     """ Save checkpoint to the disk."""
-    if not osp.exists(save_dir):
-        os.makedirs(save_dir)
+    os.makedirs(save_dir, exist_ok=True)
     filename = osp.join(save_dir, model_name + '.pt')
     torch.save(ckpt, filename)
     if is_best:
@@ -49,7 +57,7 @@ def strip_optimizer(ckpt_dir, epoch):
         ckpt_path = osp.join(ckpt_dir, '{}_ckpt.pt'.format(s))
         if not osp.exists(ckpt_path):
             continue
-        ckpt = torch.load(ckpt_path, map_location=torch.device('cpu'))
+        ckpt = torch.load(ckpt_path, map_location=torch.device('cpu'), weights_only=False)
         if ckpt.get('ema'):
             ckpt['model'] = ckpt['ema']  # replace model with ema
         for k in ['optimizer', 'ema', 'updates']:  # keys
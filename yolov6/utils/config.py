@@ -8,6 +8,7 @@ import os.path as osp
 import shutil
 import sys
 import tempfile
+from functools import lru_cache
 from importlib import import_module
 from addict import Dict
 
@@ -57,9 +58,17 @@ class Config(object):
 
         return cfg_dict, cfg_text
 
+    @staticmethod
+    @lru_cache(maxsize=8)
+    def _cached_file2dict(filename, mtime):
+        # keyed on the modification time as well, so an edited file is parsed again
+        return Config._file2dict(filename)
+
     @staticmethod
     def fromfile(filename):
-        cfg_dict, cfg_text = Config._file2dict(filename)
+        abs_filename = osp.abspath(filename)
+        cfg_dict, cfg_text = Config._cached_file2dict(abs_filename, osp.getmtime(abs_filename))
+        # ConfigDict converts nested dicts and lists into new containers, so callers may modify the returned config
         return Config(cfg_dict, cfg_text=cfg_text, filename=filename)
 
     def __init__(self, cfg_dict=None, cfg_text=None, filename=None):